@@ -0,0 +1,151 @@
+"""
+Embedding model loader for query-time encoding
+Uses the PyTorch SentenceTransformer in FP16 on a CUDA GPU when one is
+available. On CPU it uses a prebuilt, dynamically INT8-quantized ONNX Runtime
+export when one exists under ONNX_CACHE_DIR, otherwise the stock FP32 model.
+
+The ONNX export is an offline/build step, never done at import time:
+    python embeddings.py all-mpnet-base-v2 all-MiniLM-L6-v2
+"""
+
+import os
+import sys
+import json
+import logging
+from typing import List, Union
+import numpy as np
+import torch
+from sentence_transformers import SentenceTransformer
+
+logger = logging.getLogger(__name__)
+
+# Optional imports
+try:
+    import onnxruntime as ort
+    from optimum.onnxruntime import ORTModelForFeatureExtraction, ORTQuantizer
+    from optimum.onnxruntime.configuration import AutoQuantizationConfig
+    from transformers import AutoTokenizer
+    from huggingface_hub import hf_hub_download
+    ONNX_AVAILABLE = True
+except ImportError:
+    ONNX_AVAILABLE = False
+
+ONNX_CACHE_DIR = os.getenv("ONNX_CACHE_DIR", "./onnx_models")
+EMBEDDER_BACKEND = os.getenv("EMBEDDER_BACKEND", "onnx")
+DEVICE = "cuda" if torch.cuda.is_available() else "cpu"
+
+
+QUANTIZED_FILE = "model_quantized.onnx"
+ST_CONFIG_FILE = "sentence_bert_config.json"
+
+
+def _model_id(model_name: str) -> str:
+    return model_name if "/" in model_name else f"sentence-transformers/{model_name}"
+
+
+def onnx_model_dir(model_name: str, cache_dir: str = ONNX_CACHE_DIR) -> str:
+    """Directory holding the quantized export of a model"""
+    return os.path.join(cache_dir, _model_id(model_name).replace("/", "__") + "-int8")
+
+
+def export_quantized(model_name: str, cache_dir: str = ONNX_CACHE_DIR) -> str:
+    """Export the model to ONNX and apply dynamic INT8 quantization (offline step)"""
+    model_id = _model_id(model_name)
+    model_dir = onnx_model_dir(model_name, cache_dir)
+    logger.info(f"Exporting {model_id} to ONNX with INT8 quantization...")
+    model = ORTModelForFeatureExtraction.from_pretrained(model_id, export=True)
+    quantizer = ORTQuantizer.from_pretrained(model)
+    qconfig = AutoQuantizationConfig.avx512_vnni(is_static=False, per_channel=False)
+    quantizer.quantize(save_dir=model_dir, quantization_config=qconfig)
+    AutoTokenizer.from_pretrained(model_id).save_pretrained(model_dir)
+
+    # Keep the sentence-transformers config so max_seq_length matches PyTorch
+    with open(hf_hub_download(model_id, ST_CONFIG_FILE), "r", encoding="utf-8") as src:
+        st_config = json.load(src)
+    with open(os.path.join(model_dir, ST_CONFIG_FILE), "w", encoding="utf-8") as dst:
+        json.dump(st_config, dst)
+    return model_dir
+
+
+class ONNXEmbedder:
+    """Minimal SentenceTransformer-compatible encoder backed by ONNX Runtime"""
+
+    def __init__(self, model_dir: str):
+        self.tokenizer = AutoTokenizer.from_pretrained(model_dir)
+        self.session = ort.InferenceSession(
+            os.path.join(model_dir, QUANTIZED_FILE),
+            providers=["CPUExecutionProvider"]
+        )
+        self.input_names = {i.name for i in self.session.get_inputs()}
+
+        with open(os.path.join(model_dir, ST_CONFIG_FILE), "r", encoding="utf-8") as f:
+            self.max_seq_length = json.load(f)["max_seq_length"]
+
+    def _encode_batch(self, texts: List[str]) -> np.ndarray:
+        features = self.tokenizer(
+            texts,
+            padding=True,
+            truncation=True,
+            max_length=self.max_seq_length,
+            return_tensors="np"
+        )
+        inputs = {k: v.astype(np.int64) for k, v in features.items() if k in self.input_names}
+        token_embeddings = self.session.run(None, inputs)[0]
+
+        # Mean pooling over non-padding tokens
+        mask = features["attention_mask"][..., None].astype(np.float32)
+        summed = (token_embeddings * mask).sum(axis=1)
+        return summed / np.clip(mask.sum(axis=1), 1e-9, None)
+
+    def encode(
+        self,
+        sentences: Union[str, List[str]],
+        batch_size: int = 32,
+        normalize_embeddings: bool = True,
+        **kwargs
+    ) -> np.ndarray:
+        """Encode one string (returns 1-D) or a list of strings (returns 2-D)"""
+        single = isinstance(sentences, str)
+        texts = [sentences] if single else list(sentences)
+
+        embeddings = np.vstack([
+            self._encode_batch(texts[i:i + batch_size])
+            for i in range(0, len(texts), batch_size)
+        ]) if texts else np.empty((0, 0), dtype=np.float32)
+
+        if normalize_embeddings and len(embeddings):
+            embeddings /= np.clip(np.linalg.norm(embeddings, axis=1, keepdims=True), 1e-12, None)
+
+        return embeddings[0] if single else embeddings
+
+
+def load_embedder(model_name: str):
+    """Load the FP16 GPU model, the quantized ONNX embedder, or the FP32 CPU model"""
+    if DEVICE == "cuda":
+        embedder = SentenceTransformer(model_name, device=DEVICE)
+        embedder.half()
+        logger.info(f"Loaded {model_name} on CUDA (FP16)")
+        return embedder
+
+    model_dir = onnx_model_dir(model_name)
+    if ONNX_AVAILABLE and EMBEDDER_BACKEND == "onnx" and os.path.exists(os.path.join(model_dir, QUANTIZED_FILE)):
+        try:
+            embedder = ONNXEmbedder(model_dir)
+            logger.info(f"Loaded {model_name} with ONNX Runtime (INT8)")
+            return embedder
+        except Exception as e:
+            logger.warning(f"ONNX embedder unavailable, falling back to PyTorch: {e}")
+
+    embedder = SentenceTransformer(model_name, device=DEVICE)
+    logger.info(f"Loaded {model_name} with PyTorch on {DEVICE} (FP32)")
+    return embedder
+
+
+# Build step: export quantized models for the names given on the command line
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    if not ONNX_AVAILABLE:
+        logger.warning("optimum/onnxruntime not installed; skipping ONNX export")
+        sys.exit(0)
+    for name in sys.argv[1:] or ["all-mpnet-base-v2"]:
+        logger.info(f"Exported {name} to {export_quantized(name)}")
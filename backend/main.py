@@ -1,15 +1,25 @@
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, HTTPException, Request, Response
 from fastapi.middleware.cors import CORSMiddleware
-from pydantic import BaseModel
+from fastapi.responses import StreamingResponse
+from pydantic import BaseModel, Field
 import google.generativeai as genai
+from google.generativeai import caching
 from dotenv import load_dotenv
 import os
+import re
+import json
+import hashlib
 import asyncio
 import time
+import datetime
 import logging
-from typing import Optional, List
-from qdrant_client import QdrantClient
-from sentence_transformers import SentenceTransformer
+import anyio.to_thread
+import torch
+from functools import lru_cache
+from typing import Optional, List, Tuple, Any
+from qdrant_client import AsyncQdrantClient, QdrantClient, models
+from embeddings import load_embedder
+from semantic_cache import SemanticCache
 
 # Logging setup
 logging.basicConfig(
@@ -40,6 +50,7 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["ETag"],
 )
 
 # Gemini AI Configuration
@@ -48,7 +59,18 @@ if not GEMINI_API_KEY:
     raise ValueError("GEMINI_API_KEY not found in environment variables")
 
 genai.configure(api_key=GEMINI_API_KEY)
-MODEL = genai.GenerativeModel("models/gemini-2.0-flash-exp")
+MODEL_NAME = "models/gemini-2.0-flash-exp"
+MODEL = genai.GenerativeModel(MODEL_NAME)
+
+# Explicit context cache for the static system prompt (see setup_prompt_cache).
+# Off by default: gemini-2.0-flash-exp does not support CachedContent and the
+# system prompt is below the caching minimum. Enable for a model/prompt that is.
+PROMPT_CACHE_ENABLED = os.getenv("GEMINI_PROMPT_CACHE", "false").lower() == "true"
+PROMPT_CACHE_TTL = datetime.timedelta(minutes=10)
+PROMPT_CACHE_REFRESH_SECONDS = 8 * 60
+prompt_cache: Optional[caching.CachedContent] = None
+cached_model: Optional[genai.GenerativeModel] = None
+last_request_time = 0.0
 
 # Qdrant Configuration
 QDRANT_URL = os.getenv("QDRANT_URL")
@@ -59,13 +81,54 @@ if not QDRANT_URL or not QDRANT_API_KEY:
     raise ValueError("QDRANT credentials not found in environment variables")
 
 # Initialize Qdrant client and embedder
-client = QdrantClient(url=QDRANT_URL, api_key=QDRANT_API_KEY)
-embedder = SentenceTransformer("all-mpnet-base-v2")
+QDRANT_OPTIONS = {
+    "url": QDRANT_URL,
+    "api_key": QDRANT_API_KEY,
+    "prefer_grpc": True,
+    "grpc_port": 6334,
+    "timeout": 10.0,
+}
+client = QdrantClient(**QDRANT_OPTIONS)
+aclient = AsyncQdrantClient(**QDRANT_OPTIONS)  # used on the /ask hot path
+embedder = load_embedder("all-mpnet-base-v2")
+
+def build_search_params(top_k: int, hnsw_ef: Optional[int] = None) -> models.SearchParams:
+    """
+    HNSW beam width scales with top_k unless the client overrides it.
+    Scores against the INT8-quantized vectors, then rescores the top candidates.
+    """
+    return models.SearchParams(
+        hnsw_ef=hnsw_ef if hnsw_ef is not None else max(64, 8 * top_k),
+        exact=False,
+        quantization=models.QuantizationSearchParams(ignore=False, rescore=True, oversampling=2.0)
+    )
+
+# Semantic response cache (persisted across restarts). Only requests with the
+# default retrieval parameters are cached. Entries expire after the TTL, and a
+# saved cache is dropped on startup if the collection's point count changed.
+SEMANTIC_CACHE_PATH = os.getenv("SEMANTIC_CACHE_PATH", "./semantic_cache")
+SEMANTIC_CACHE_TTL_SECONDS = float(os.getenv("SEMANTIC_CACHE_TTL_SECONDS", 24 * 3600))
+response_cache = SemanticCache(capacity=10_000, threshold=0.97, ttl_seconds=SEMANTIC_CACHE_TTL_SECONDS)
+
+_WHITESPACE_RE = re.compile(r"\s+")
+
+def normalize_question(text: str) -> str:
+    """Normalize question text so trivially different phrasings share a cache key"""
+    return _WHITESPACE_RE.sub(" ", text.strip().lower())
+
+@lru_cache(maxsize=2048)
+def _embed(text: str) -> Tuple[float, ...]:
+    """Embed normalized question text (cached; returns an immutable tuple)"""
+    with torch.inference_mode():
+        return tuple(embedder.encode(text, normalize_embeddings=True).tolist())
 
 # Request/Response Models
+DEFAULT_TOP_K = 5
+
 class Question(BaseModel):
     question: str
-    top_k: Optional[int] = 5
+    top_k: int = Field(DEFAULT_TOP_K, ge=1, le=50)
+    hnsw_ef: Optional[int] = Field(None, ge=1, le=1024)  # Lower for faster, less exhaustive search
 
 class Source(BaseModel):
     source: str
@@ -76,8 +139,10 @@ class ChatResponse(BaseModel):
     sources: List[Source]
     response_time: Optional[float] = None
 
-# Enhanced prompt template
-SYSTEM_PROMPT = """You are a helpful and professional university assistant for VIT-AP University.
+# Enhanced prompt template, split so the static instructions are sent as the
+# system instruction (cacheable by Gemini) and only the suffix changes per
+# request. Keep STATIC_PREFIX byte-for-byte stable: no timestamps or version strings.
+STATIC_PREFIX = """You are a helpful and professional university assistant for VIT-AP University.
 
 **Instructions:**
 - Use ONLY the context provided below to answer questions
@@ -89,9 +154,9 @@ SYSTEM_PROMPT = """You are a helpful and professional university assistant for V
 - Always structure fee information in a clear, organized format
 - If information is not in the context, politely say "I don't have that information in my knowledge base. Please visit vitap.ac.in for more details."
 - Be concise but comprehensive
-- Always end with a note directing users to the official website for the most current information
+- Always end with a note directing users to the official website for the most current information"""
 
-**Context:**
+DYNAMIC_SUFFIX = """**Context:**
 {context}
 
 **Question:**
@@ -99,12 +164,236 @@ SYSTEM_PROMPT = """You are a helpful and professional university assistant for V
 
 **Answer:**"""
 
+# Used when no explicit context cache is available
+INSTRUCTED_MODEL = genai.GenerativeModel(MODEL_NAME, system_instruction=STATIC_PREFIX)
+
+def build_prompt(context: str, question: str) -> Tuple[Any, List[str]]:
+    """
+    Pick the model and build the per-request prompt. The system prompt is
+    never part of the prompt itself: it comes from the Gemini context cache
+    when one exists, otherwise from the model's system_instruction.
+    """
+    model = cached_model or INSTRUCTED_MODEL
+    return model, [DYNAMIC_SUFFIX.format(context=context, question=question)]
+
+GENERATION_CONFIG = {
+    "temperature": 0.3,
+    "top_p": 0.8,
+    "top_k": 40,
+    "max_output_tokens": 1024,
+}
+
+NOT_FOUND_ANSWER = "I couldn't find relevant information in my knowledge base. Please visit [vitap.ac.in](https://vitap.ac.in/) for more details."
+WEBSITE_FOOTER = "\n\n*For the most current information, please visit [vitap.ac.in](https://vitap.ac.in/)*"
+
+# Small talk answered directly, without embedding, retrieval or generation
+SMALLTALK_RESPONSES = [
+    (
+        re.compile(r"^\s*(hi|hello|hey|good (morning|afternoon|evening))\W*$", re.I),
+        "Hello! I'm the VIT-AP University assistant. Ask me about admissions, hostels, policies, campus life or research."
+    ),
+    (
+        re.compile(r"^\s*(thanks|thank you|thx)\W*$", re.I),
+        "You're welcome! Let me know if you have any other questions about VIT-AP University."
+    ),
+    (
+        re.compile(r"^\s*(bye|goodbye|see you)\W*$", re.I),
+        "Goodbye! For more details, you can always visit [vitap.ac.in](https://vitap.ac.in/)."
+    ),
+]
+
+def smalltalk_answer(question: str) -> Optional[str]:
+    """Return a canned reply for greetings/thanks/farewells, else None"""
+    for pattern, answer in SMALLTALK_RESPONSES:
+        if pattern.match(question):
+            return answer
+    return None
+
+@app.on_event("startup")
+async def warmup_qdrant():
+    """Size the worker thread pool and open the gRPC channel to Qdrant"""
+    anyio.to_thread.current_default_thread_limiter().total_tokens = (os.cpu_count() or 1) * 2
+    try:
+        await aclient.get_collection(COLLECTION_NAME)
+        logger.info("Qdrant connection warmed up")
+    except Exception as e:
+        logger.warning(f"Qdrant warmup failed: {str(e)}")
+
+@app.on_event("startup")
+async def load_response_cache():
+    """Restore the semantic response cache saved at the last shutdown, if still current"""
+    try:
+        points = (await aclient.count(COLLECTION_NAME, exact=True)).count
+        response_cache.load(SEMANTIC_CACHE_PATH, fingerprint=f"{COLLECTION_NAME}:{points}")
+    except Exception as e:
+        logger.warning(f"Failed to load semantic cache: {str(e)}")
+
+@app.on_event("shutdown")
+def save_response_cache():
+    """Persist the semantic response cache"""
+    try:
+        response_cache.save(SEMANTIC_CACHE_PATH)
+    except Exception as e:
+        logger.warning(f"Failed to save semantic cache: {str(e)}")
+
+def create_prompt_cache():
+    """Create the context cache for STATIC_PREFIX (blocking)"""
+    global prompt_cache, cached_model
+    prompt_cache = caching.CachedContent.create(
+        model=MODEL_NAME,
+        system_instruction=STATIC_PREFIX,
+        ttl=PROMPT_CACHE_TTL
+    )
+    cached_model = genai.GenerativeModel.from_cached_content(prompt_cache)
+
+def drop_prompt_cache():
+    """Fall back to the system_instruction model and release the cache (blocking)"""
+    global prompt_cache, cached_model
+    cache, prompt_cache, cached_model = prompt_cache, None, None
+    try:
+        cache.delete()
+    except Exception as e:
+        logger.warning(f"Failed to delete Gemini prompt cache: {str(e)}")
+
+async def refresh_prompt_cache():
+    """
+    Keep the prompt cache alive while requests are flowing; let it go when
+    idle and recreate it once traffic returns. Stops for good if the cache
+    cannot be recreated.
+    """
+    global prompt_cache, cached_model
+    while True:
+        await asyncio.sleep(PROMPT_CACHE_REFRESH_SECONDS)
+        active = time.time() - last_request_time < PROMPT_CACHE_REFRESH_SECONDS
+        if active and prompt_cache is None:
+            try:
+                await anyio.to_thread.run_sync(create_prompt_cache)
+            except Exception as e:
+                prompt_cache, cached_model = None, None
+                logger.warning(f"Gemini prompt cache could not be recreated, disabling: {str(e)}")
+                return
+            continue
+        try:
+            if active:
+                await anyio.to_thread.run_sync(lambda: prompt_cache.update(ttl=PROMPT_CACHE_TTL))
+            elif prompt_cache is not None:
+                await anyio.to_thread.run_sync(drop_prompt_cache)
+        except Exception as e:
+            # Use the system_instruction model until the cache is recreated
+            prompt_cache, cached_model = None, None
+            logger.warning(f"Gemini prompt cache refresh failed: {str(e)}")
+
+@app.on_event("startup")
+async def setup_prompt_cache():
+    """Create the Gemini context cache for the system prompt, if enabled"""
+    app.state.prompt_cache_task = None
+    if not PROMPT_CACHE_ENABLED:
+        return
+    try:
+        await anyio.to_thread.run_sync(create_prompt_cache)
+        logger.info("Gemini prompt cache created")
+    except Exception as e:
+        # Unsupported models and prompts below the caching minimum are rejected;
+        # stay on the system_instruction model and don't retry
+        logger.warning(f"Gemini prompt cache unavailable, using system_instruction: {str(e)}")
+        return
+    app.state.prompt_cache_task = asyncio.create_task(refresh_prompt_cache())
+
+@app.on_event("shutdown")
+async def stop_prompt_cache():
+    """Cancel the prompt cache refresh task"""
+    task = getattr(app.state, "prompt_cache_task", None)
+    if task is not None:
+        task.cancel()
+
+def sse_event(data: dict) -> str:
+    """Format a payload as a Server-Sent Events message"""
+    return f"data: {json.dumps(data)}\n\n"
+
+def stream_fixed_answer(answer: str, sources: List[Source], start_time: float):
+    """Yield an already complete answer as a single SSE `delta` plus the final event"""
+    yield sse_event({"delta": answer})
+    yield sse_event({
+        "sources": [s.model_dump() for s in sources],
+        "response_time": round(time.time() - start_time, 2)
+    })
+
+async def stream_answer(
+    model: Any,
+    prompt: List[str],
+    sources: List[Source],
+    start_time: float,
+    question: str,
+    cache_vector: Optional[List[float]]
+):
+    """
+    Yield the answer as SSE `delta` events, followed by a final event
+    carrying the sources and response time. The answer is added to the
+    response cache under `cache_vector` unless it is None.
+    """
+    answer = ""
+    try:
+        response = await model.generate_content_async(
+            prompt,
+            stream=True,
+            generation_config=GENERATION_CONFIG
+        )
+        async for chunk in response:
+            # Trailing chunks may carry only a finish reason and no text parts
+            delta = chunk.text if chunk.parts else ""
+            if delta:
+                answer += delta
+                yield sse_event({"delta": delta})
+        
+        if not answer.strip():
+            # Blocked or empty completion: report it rather than caching a bare footer
+            logger.warning("Gemini returned no text for streamed answer")
+            yield sse_event({"error": "An error occurred while processing your question. Please try again."})
+            return
+        
+        if "vitap.ac.in" not in answer.lower():
+            answer += WEBSITE_FOOTER
+            yield sse_event({"delta": WEBSITE_FOOTER})
+        
+        response_time = round(time.time() - start_time, 2)
+        logger.info(f"Response streamed in {response_time}s")
+        
+        yield sse_event({
+            "sources": [s.model_dump() for s in sources],
+            "response_time": response_time
+        })
+        
+        if cache_vector is not None:
+            response_cache.add(cache_vector, question, answer.strip(), [s.model_dump() for s in sources])
+    except Exception as e:
+        logger.error(f"Error streaming answer: {str(e)}", exc_info=True)
+        yield sse_event({"error": "An error occurred while processing your question. Please try again."})
+
+def question_etag(q: Question, stream: bool) -> str:
+    """
+    Weak ETag for a question: answers are semantically, not byte-for-byte,
+    equivalent. Keyed on normalized text, retrieval parameters and the
+    representation (SSE vs JSON).
+    """
+    key = f"{normalize_question(q.question)}|{q.top_k}|{q.hnsw_ef}|{stream}"
+    return f'W/"{hashlib.sha1(key.encode()).hexdigest()}"'
+
+def etag_matches(if_none_match: str, etag: str) -> bool:
+    """Weak comparison of an If-None-Match header against an ETag"""
+    tags = [t.strip() for t in if_none_match.split(",") if t.strip()]
+    if "*" in tags:
+        return True
+    opaque = etag.removeprefix("W/")
+    return any(t.removeprefix("W/") == opaque for t in tags)
+
 @app.post("/ask", response_model=ChatResponse)
-async def ask_question(q: Question):
+async def ask_question(q: Question, request: Request, response: Response, stream: bool = True):
     """
-    Process user questions using RAG pipeline with Qdrant and Gemini
+    Process user questions using RAG pipeline with Qdrant and Gemini.
+    Streams the answer as Server-Sent Events unless `?stream=false`.
     """
-    start_time = time.time()
+    global last_request_time
+    start_time = last_request_time = time.time()
     
     try:
         if not q.question or len(q.question.strip()) == 0:
@@ -113,68 +402,121 @@ async def ask_question(q: Question):
         if len(q.question) > 500:
             raise HTTPException(status_code=400, detail="Question too long (max 500 characters)")
         
+        # Let clients revalidate repeated questions without any server-side work
+        # Cache headers are only attached to successful, fully known responses
+        etag = question_etag(q, stream)
+        cache_headers = {"ETag": etag, "Cache-Control": "private, max-age=60"}
+        if etag_matches(request.headers.get("if-none-match", ""), etag):
+            return Response(status_code=304, headers=cache_headers)
+        
         logger.info(f"Processing question: {q.question[:50]}...")
         
-        # Generate embedding
-        query_vector = embedder.encode(q.question).tolist()
+        canned = smalltalk_answer(q.question)
+        if canned is not None:
+            if stream:
+                return StreamingResponse(
+                    stream_fixed_answer(canned, [], start_time),
+                    media_type="text/event-stream",
+                    headers=cache_headers
+                )
+            response.headers.update(cache_headers)
+            return ChatResponse(
+                answer=canned,
+                sources=[],
+                response_time=round(time.time() - start_time, 2)
+            )
+        
+        # Generate embedding off the event loop
+        query_vector = list(
+            await anyio.to_thread.run_sync(_embed, normalize_question(q.question))
+        )
+        
+        # Serve semantically equivalent questions from the response cache; it only
+        # holds answers built with the default retrieval parameters
+        use_cache = q.top_k == DEFAULT_TOP_K and q.hnsw_ef is None
+        cached = response_cache.lookup(query_vector) if use_cache else None
+        if cached is not None:
+            logger.info(f"Semantic cache hit: {cached['question'][:50]}...")
+            sources = [Source(**s) for s in cached["sources"]]
+            if stream:
+                return StreamingResponse(
+                    stream_fixed_answer(cached["answer"], sources, start_time),
+                    media_type="text/event-stream",
+                    headers=cache_headers
+                )
+            response.headers.update(cache_headers)
+            return ChatResponse(
+                answer=cached["answer"],
+                sources=sources,
+                response_time=round(time.time() - start_time, 2)
+            )
         
         # Search Qdrant
-        search_results = client.search(
+        search_results = (await aclient.query_points(
             collection_name=COLLECTION_NAME,
-            query_vector=query_vector,
-            limit=q.top_k
-        )
+            query=query_vector,
+            limit=q.top_k,
+            search_params=build_search_params(q.top_k, q.hnsw_ef),
+            with_payload=["context_chunk", "metadata.source"],
+            with_vectors=False
+        )).points
+        
+        sources = [
+            Source(
+                source=r.payload["metadata"]["source"],
+                score=round(r.score, 3)
+            )
+            for r in search_results
+        ]
         
         if not search_results:
             logger.warning("No relevant documents found in Qdrant")
+            if stream:
+                return StreamingResponse(
+                    stream_fixed_answer(NOT_FOUND_ANSWER, [], start_time),
+                    media_type="text/event-stream",
+                    headers=cache_headers
+                )
+            response.headers.update(cache_headers)
             return ChatResponse(
-                answer="I couldn't find relevant information in my knowledge base. Please visit [vitap.ac.in](https://vitap.ac.in/) for more details.",
+                answer=NOT_FOUND_ANSWER,
                 sources=[],
                 response_time=round(time.time() - start_time, 2)
             )
         
         # Build context
-        context = "\n\n---\n\n".join([
-            f"Source: {r.payload['metadata']['source']}\n{r.payload['text']}"
-            for r in search_results
-        ])
+        context = "\n\n---\n\n".join(r.payload["context_chunk"] for r in search_results)
         
         # Create enhanced prompt
-        prompt = SYSTEM_PROMPT.format(
-            context=context,
-            question=q.question
-        )
+        model, prompt = build_prompt(context, q.question)
+        
+        if stream:
+            return StreamingResponse(
+                stream_answer(model, prompt, sources, start_time, q.question, query_vector if use_cache else None),
+                media_type="text/event-stream",
+                headers={"Cache-Control": "no-store"}
+            )
         
         loop = asyncio.get_event_loop()
-        response = await loop.run_in_executor(
+        completion = await loop.run_in_executor(
             None,
-            lambda: MODEL.generate_content(
-                prompt,
-                generation_config={
-                    "temperature": 0.3,
-                    "top_p": 0.8,
-                    "top_k": 40,
-                    "max_output_tokens": 1024,
-                }
-            )
+            lambda: model.generate_content(prompt, generation_config=GENERATION_CONFIG)
         )
         
-        answer = response.text.strip()
+        answer = completion.text.strip()
+        if not answer:
+            raise ValueError("Gemini returned an empty response")
         
         if "vitap.ac.in" not in answer.lower():
-            answer += "\n\n*For the most current information, please visit [vitap.ac.in](https://vitap.ac.in/)*"
+            answer += WEBSITE_FOOTER
         
-        sources = [
-            Source(
-                source=r.payload["metadata"]["source"],
-                score=round(r.score, 3)
-            )
-            for r in search_results
-        ]
+        if use_cache:
+            response_cache.add(query_vector, q.question, answer, [s.model_dump() for s in sources])
         
         response_time = round(time.time() - start_time, 2)
         logger.info(f"Response generated in {response_time}s")
         
+        response.headers.update(cache_headers)
         return ChatResponse(
             answer=answer,
             sources=sources,
@@ -6,8 +6,8 @@ Handles vector search and context retrieval
 import os
 from typing import List, Dict
 from dotenv import load_dotenv
-from qdrant_client import QdrantClient
-from sentence_transformers import SentenceTransformer
+from qdrant_client import QdrantClient, models
+from embeddings import load_embedder
 import logging
 
 logging.basicConfig(level=logging.INFO)
@@ -22,15 +22,18 @@ class RAGService:
         self.qdrant_api_key = os.getenv("QDRANT_API_KEY")
         self.collection_name = os.getenv("COLLECTION_NAME", "university_knowledge")
         
-        # Connect to Qdrant
-        if self.qdrant_api_key:
-            self.client = QdrantClient(url=self.qdrant_url, api_key=self.qdrant_api_key)
-        else:
-            self.client = QdrantClient(url=self.qdrant_url)
+        # Connect to Qdrant (gRPC; one client per process via get_rag_service)
+        self.client = QdrantClient(
+            url=self.qdrant_url,
+            api_key=self.qdrant_api_key,
+            prefer_grpc=True,
+            grpc_port=6334,
+            timeout=10.0
+        )
         
         # Initialize embedding model (same as ingestion)
         logger.info("Loading embedding model...")
-        self.embedder = SentenceTransformer('all-MiniLM-L6-v2')
+        self.embedder = load_embedder('all-MiniLM-L6-v2')
         
         logger.info(f"RAG Service initialized with collection: {self.collection_name}")
     
@@ -47,14 +50,19 @@ class RAGService:
         """
         try:
             # Generate query embedding
-            query_vector = self.embedder.encode(query).tolist()
+            query_vector = self.embedder.encode(query, normalize_embeddings=True).tolist()
             
             # Search in Qdrant
-            search_results = self.client.search(
+            search_results = self.client.query_points(
                 collection_name=self.collection_name,
-                query_vector=query_vector,
-                limit=top_k
-            )
+                query=query_vector,
+                limit=top_k,
+                search_params=models.SearchParams(
+                    quantization=models.QuantizationSearchParams(ignore=False, rescore=True, oversampling=2.0)
+                ),
+                with_payload=["text", "metadata.source"],
+                with_vectors=False
+            ).points
             
             # Format results
             results = []
@@ -9,22 +9,36 @@ Improved Data Upload Script for Qdrant Cloud
 import os
 import json
 import re
-import random
 import time
+import uuid
+import hashlib
+from concurrent.futures import ProcessPoolExecutor
 from typing import List, Dict
 from openai import OpenAI
 from dotenv import load_dotenv
 from qdrant_client import QdrantClient
-from qdrant_client.models import Distance, VectorParams, PointStruct
+from qdrant_client.models import (
+    Distance, VectorParams, PointStruct, HnswConfigDiff,
+    ScalarQuantization, ScalarQuantizationConfig, ScalarType,
+    Filter, FilterSelector, IsEmptyCondition, PayloadField,
+)
 from sentence_transformers import SentenceTransformer
 
 # Optional imports
+try:
+    import pypdfium2 as pdfium
+    PDFIUM_AVAILABLE = True
+except ImportError:
+    PDFIUM_AVAILABLE = False
+    print("⚠️ pypdfium2 not installed. Falling back to the slower PyPDF2 reader.")
+
 try:
     import PyPDF2
     PDF_AVAILABLE = True
 except ImportError:
-    PDF_AVAILABLE = False
-    print("⚠️ PyPDF2 not installed. PDF files will be skipped.")
+    PDF_AVAILABLE = PDFIUM_AVAILABLE
+    if not PDF_AVAILABLE:
+        print("⚠️ pypdfium2/PyPDF2 not installed. PDF files will be skipped.")
 
 try:
     from docx import Document as DocxDocument
@@ -43,6 +57,13 @@ except ImportError:
 # Load environment
 load_dotenv()
 
+# Precompiled patterns for clean_text / chunk_text
+_RE_BLANKLINES = re.compile(r'(\n\s*){2,}')
+_RE_HOME = re.compile(r'Home\s*>.*')
+_RE_PAGE = re.compile(r'Page\s*\d+\s*of\s*\d+')
+_RE_WS = re.compile(r'\s{2,}')
+_RE_WORD = re.compile(r'\S+')
+
 
 class DataUploader:
     def __init__(self):
@@ -82,35 +103,70 @@ class DataUploader:
             self.client.create_collection(
                 collection_name=self.collection_name,
                 vectors_config=VectorParams(size=self.vector_size, distance=Distance.COSINE),
+                **self.index_config(),
             )
         else:
             print(f"✅ Collection '{self.collection_name}' already exists. Data will be added.\n")
+            # Apply index tuning to collections created before it was configured
+            self.client.update_collection(
+                collection_name=self.collection_name,
+                **self.index_config(),
+            )
+
+    @staticmethod
+    def index_config() -> Dict:
+        """
+        HNSW build parameters and INT8 scalar quantization (kept in RAM; originals
+        are used for rescoring). Shared by create and update so they can't drift.
+        """
+        return {
+            "hnsw_config": HnswConfigDiff(m=16, ef_construct=200, full_scan_threshold=10000),
+            "quantization_config": ScalarQuantization(
+                scalar=ScalarQuantizationConfig(type=ScalarType.INT8, quantile=0.99, always_ram=True)
+            ),
+        }
 
     # ---------------------------------------------------------------------
-    def clean_text(self, text: str) -> str:
+    @staticmethod
+    def clean_text(text: str) -> str:
         """Cleans unnecessary symbols and whitespace."""
-        text = re.sub(r'(\n\s*){2,}', '\n', text)
-        text = re.sub(r'Home\s*>.*', '', text)
-        text = re.sub(r'Page\s*\d+\s*of\s*\d+', '', text)
-        text = re.sub(r'\s{2,}', ' ', text)
+        text = _RE_BLANKLINES.sub('\n', text)
+        text = _RE_HOME.sub('', text)
+        text = _RE_PAGE.sub('', text)
+        text = _RE_WS.sub(' ', text)
         return text.strip()
 
-    def chunk_text(self, text: str, chunk_size: int = 400, overlap: int = 80) -> List[str]:
+    @staticmethod
+    def chunk_text(text: str, chunk_size: int = 400, overlap: int = 80) -> List[str]:
         """Splits text into overlapping chunks for better retrieval."""
-        words = text.split()
+        # Slice the original string by word offsets instead of re-joining word lists
+        spans = [m.span() for m in _RE_WORD.finditer(text)]
+        n = len(spans)
         chunks = []
-        for i in range(0, len(words), chunk_size - overlap):
-            chunk = " ".join(words[i:i + chunk_size])
-            if len(chunk) > 50:  # Skip tiny fragments
-                chunks.append(chunk)
+        for i in range(0, n, chunk_size - overlap):
+            j = min(i + chunk_size, n)
+            if j - i >= 10:  # Skip tiny fragments
+                chunks.append(text[spans[i][0]:spans[j - 1][1]])
         return chunks
 
     # ---------------------------------------------------------------------
-    def read_pdf(self, path: str) -> str:
+    @staticmethod
+    def read_pdf(path: str) -> str:
         if not PDF_AVAILABLE:
             return ""
         text = ""
         try:
+            if PDFIUM_AVAILABLE:
+                # pypdfium2 extracts text several times faster than PyPDF2
+                pdf = pdfium.PdfDocument(path)
+                try:
+                    for page in pdf:
+                        page_text = page.get_textpage().get_text_range()
+                        if page_text:
+                            text += page_text + "\n"
+                finally:
+                    pdf.close()
+                return text
             with open(path, "rb") as f:
                 reader = PyPDF2.PdfReader(f)
                 for page in reader.pages:
@@ -121,7 +177,8 @@ class DataUploader:
             print(f"⚠️ PDF read error {path}: {e}")
         return text
 
-    def read_docx(self, path: str) -> str:
+    @staticmethod
+    def read_docx(path: str) -> str:
         if not DOCX_AVAILABLE:
             return ""
         try:
@@ -131,7 +188,8 @@ class DataUploader:
             print(f"⚠️ DOCX read error {path}: {e}")
             return ""
 
-    def read_txt(self, path: str) -> str:
+    @staticmethod
+    def read_txt(path: str) -> str:
         try:
             with open(path, "r", encoding="utf-8", errors="ignore") as f:
                 return f.read()
@@ -139,7 +197,8 @@ class DataUploader:
             print(f"⚠️ TXT read error {path}: {e}")
             return ""
 
-    def read_json(self, path: str) -> List[str]:
+    @staticmethod
+    def read_json(path: str) -> List[str]:
         try:
             with open(path, "r", encoding="utf-8") as f:
                 data = json.load(f)
@@ -148,7 +207,8 @@ class DataUploader:
             print(f"⚠️ JSON read error {path}: {e}")
             return []
 
-    def read_csv(self, path: str) -> List[str]:
+    @staticmethod
+    def read_csv(path: str) -> List[str]:
         if not PANDAS_AVAILABLE:
             return []
         try:
@@ -159,7 +219,9 @@ class DataUploader:
             return []
 
     # ---------------------------------------------------------------------
-    def process_file(self, path: str) -> List[Dict]:
+    @classmethod
+    def process_file(cls, path: str) -> List[Dict]:
+        """Extract, clean and chunk one file (runs in a worker process; no model or client access)."""
         filename = os.path.basename(path)
         ext = os.path.splitext(filename)[1].lower()
         print(f"📄 Processing {filename}")
@@ -169,67 +231,142 @@ class DataUploader:
 
         # File extract
         if ext == ".pdf":
-            text = self.read_pdf(path)
+            text = cls.read_pdf(path)
         elif ext == ".docx":
-            text = self.read_docx(path)
+            text = cls.read_docx(path)
         elif ext == ".txt":
-            text = self.read_txt(path)
+            text = cls.read_txt(path)
         elif ext == ".json":
-            for i, t in enumerate(self.read_json(path)):
+            for i, t in enumerate(cls.read_json(path)):
                 docs.append({"text": t, "metadata": {"source": filename, "type": "json", "chunk": i}})
         elif ext == ".csv":
-            for i, t in enumerate(self.read_csv(path)):
+            for i, t in enumerate(cls.read_csv(path)):
                 docs.append({"text": t, "metadata": {"source": filename, "type": "csv", "chunk": i}})
 
         # Clean + Chunk
         if text:
-            text = self.clean_text(text)
-            chunks = self.chunk_text(text)
+            text = cls.clean_text(text)
+            chunks = cls.chunk_text(text)
             for i, chunk in enumerate(chunks):
                 docs.append({"text": chunk, "metadata": {"source": filename, "type": ext.strip('.'), "chunk": i}})
 
+        # Pre-render the context block used by /ask so it isn't rebuilt per request
+        for doc in docs:
+            doc["context_chunk"] = f"Source: {filename}\n{doc['text']}"
+
         print(f"   ✅ Extracted {len(docs)} chunks\n")
         return docs
 
     # ---------------------------------------------------------------------
+    @staticmethod
+    def point_id(doc: Dict) -> str:
+        """
+        Deterministic UUID for a chunk, so re-ingesting overwrites instead of duplicating.
+        Older random integer-ID points are not matched; see remove_legacy_points().
+        """
+        meta = doc["metadata"]
+        digest = hashlib.sha1(doc["text"].encode("utf-8")).hexdigest()
+        return str(uuid.uuid5(uuid.NAMESPACE_URL, f"{meta['source']}:{meta['chunk']}:{digest}"))
+
+    @staticmethod
+    def legacy_filter() -> Filter:
+        """Points written before payloads carried context_chunk (random integer IDs)."""
+        return Filter(must=[IsEmptyCondition(is_empty=PayloadField(key="context_chunk"))])
+
+    def count_legacy_points(self) -> int:
+        return self.client.count(
+            collection_name=self.collection_name, count_filter=self.legacy_filter(), exact=True
+        ).count
+
+    def remove_legacy_points(self):
+        """One-time migration: drop pre-UUID points now duplicated by the new upload."""
+        legacy = self.count_legacy_points()
+        if legacy:
+            print(f"🧹 Removing {legacy} legacy points superseded by this upload...")
+            self.client.delete(
+                collection_name=self.collection_name,
+                points_selector=FilterSelector(filter=self.legacy_filter()),
+                wait=True,
+            )
+            print("   ✅ Legacy points removed\n")
+
     def upload_data(self, folder: str = "./data"):
         if not os.path.exists(folder):
             raise FileNotFoundError(f"❌ Data folder not found: {folder}")
 
+        legacy = self.count_legacy_points()
+        if legacy:
+            print(f"⚠️ Found {legacy} legacy points with random integer IDs. The new UUID-keyed "
+                  "points won't overwrite them; they are deleted once this upload is fully verified.\n")
+
         files = [os.path.join(folder, f) for f in os.listdir(folder) if os.path.isfile(os.path.join(folder, f))]
+        # Text extraction is CPU-bound: one worker process per core, embedding stays here
         all_docs = []
-        for f in files:
-            all_docs.extend(self.process_file(f))
+        with ProcessPoolExecutor(max_workers=os.cpu_count()) as ex:
+            for docs in ex.map(DataUploader.process_file, files):
+                all_docs.extend(docs)
 
         print(f"📊 Total chunks to upload: {len(all_docs)}\n")
 
-        batch_size = 10  # smaller batch to prevent timeout
-        uploaded = 0
+        # Embed everything in one batched call (encode() sorts by length internally)
+        print("🧮 Generating embeddings...")
+        embeddings = self.embedder.encode(
+            [doc["text"] for doc in all_docs],
+            batch_size=64,
+            show_progress_bar=True,
+            convert_to_numpy=True,
+            normalize_embeddings=True,
+        )
+
+        batch_size = 256
+        uploaded_ids = []
 
         for i in range(0, len(all_docs), batch_size):
             batch = all_docs[i:i + batch_size]
             points = []
-            for doc in batch:
-                emb = self.embedder.encode(doc["text"]).tolist()
-                random_id = random.randint(1_000_000, 9_999_999)
-                points.append(PointStruct(id=random_id, vector=emb, payload=doc))
+            for doc, emb in zip(batch, embeddings[i:i + batch_size]):
+                points.append(PointStruct(id=self.point_id(doc), vector=emb.tolist(), payload=doc))
 
-            # Retry logic for failed uploads
+            # Retry logic for failed uploads (writes are pipelined; synced below)
             retries = 3
             for attempt in range(retries):
                 try:
-                    self.client.upsert(collection_name=self.collection_name, points=points)
+                    self.client.upsert(collection_name=self.collection_name, points=points, wait=False)
                     break  # success
                 except Exception as e:
                     print(f"⚠️ Upload failed (attempt {attempt + 1}/{retries}): {e}")
                     time.sleep(3)
             else:
                 print("❌ Skipping this batch after 3 failed attempts.")
+                continue
+
+            uploaded_ids.extend(p.id for p in points)
+            print(f"✅ Sent {len(uploaded_ids)}/{len(all_docs)}")
 
-            uploaded += len(points)
-            print(f"✅ Uploaded {uploaded}/{len(all_docs)}")
+        # Updates are applied in order, so an empty waited upsert returns only
+        # once every queued batch has been applied
+        print("\n⏳ Waiting for Qdrant to apply queued writes...")
+        self.client.upsert(collection_name=self.collection_name, points=[], wait=True)
 
-        print(f"\n🎉 Upload complete! {uploaded} chunks uploaded successfully.\n")
+        # Surface batches that were accepted but failed to apply
+        stored = 0
+        for i in range(0, len(uploaded_ids), batch_size):
+            stored += len(self.client.retrieve(
+                collection_name=self.collection_name,
+                ids=uploaded_ids[i:i + batch_size],
+                with_payload=False,
+                with_vectors=False,
+            ))
+
+        if stored < len(all_docs):
+            print(f"\n⚠️ Upload incomplete: {stored}/{len(all_docs)} chunks stored "
+                  f"({len(all_docs) - len(uploaded_ids)} skipped, {len(uploaded_ids) - stored} not applied).\n")
+            if legacy:
+                print(f"⚠️ {legacy} legacy points were kept and now duplicate the new chunks. "
+                      "Re-run the upload until it completes to remove them.\n")
+        else:
+            print(f"\n🎉 Upload complete! {stored} chunks uploaded successfully.\n")
+            self.remove_legacy_points()
 
 
 # -------------------------------------------------------------------------
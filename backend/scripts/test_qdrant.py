@@ -71,14 +71,14 @@ try:
     print("🤖 Loading embedding model for test search...")
     embedder = SentenceTransformer('all-MiniLM-L6-v2')
     query = "Btech admission requirements"
-    query_vector = embedder.encode(query).tolist()
+    query_vector = embedder.encode(query, normalize_embeddings=True).tolist()
 
     print(f"🔎 Performing search for: '{query}'")
-    results = client.search(
+    results = client.query_points(
         collection_name=COLLECTION_NAME,
-        query_vector=query_vector,
+        query=query_vector,
         limit=3
-    )
+    ).points
 
     if results:
         print(f"✅ Search returned {len(results)} results:\n")
@@ -0,0 +1,106 @@
+"""
+Semantic response cache for the /ask endpoint
+Returns a previously generated answer when a new question's embedding is
+close enough (cosine) to one already answered, skipping Qdrant and Gemini.
+
+Entries expire after `ttl_seconds`. The persisted cache also records a
+fingerprint of the knowledge base and is discarded on load when it no longer
+matches (e.g. after re-ingesting), so stale answers aren't served.
+"""
+
+import os
+import json
+import time
+import logging
+from typing import Dict, List, Optional
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+
+class SemanticCache:
+    """Fixed-capacity FIFO cache of (question vector -> answer, sources)"""
+
+    def __init__(self, capacity: int = 10_000, threshold: float = 0.97, ttl_seconds: float = 24 * 3600):
+        self.capacity = capacity
+        self.threshold = threshold
+        self.ttl_seconds = ttl_seconds
+        self.vectors: Optional[np.ndarray] = None  # allocated on first add
+        self.created_at = np.zeros(capacity, dtype=np.float64)
+        self.entries: List[Dict] = []
+        self.next_slot = 0
+        self.fingerprint: Optional[str] = None  # knowledge-base version the entries belong to
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+    @staticmethod
+    def _normalize(vector) -> np.ndarray:
+        vec = np.asarray(vector, dtype=np.float32)
+        return vec / max(float(np.linalg.norm(vec)), 1e-12)
+
+    def lookup(self, vector) -> Optional[Dict]:
+        """Return the cached entry for the most similar question above threshold"""
+        if not self.entries:
+            return None
+        n = len(self.entries)
+        sims = self.vectors[:n] @ self._normalize(vector)
+        sims[self.created_at[:n] < time.time() - self.ttl_seconds] = -np.inf  # expired
+        best = int(np.argmax(sims))
+        if sims[best] < self.threshold:
+            return None
+        return self.entries[best]
+
+    def add(self, vector, question: str, answer: str, sources: List[Dict]):
+        """Insert an answer, overwriting the oldest entry once full"""
+        vec = self._normalize(vector)
+        if self.vectors is None:
+            self.vectors = np.zeros((self.capacity, vec.shape[0]), dtype=np.float32)
+
+        entry = {"question": question, "answer": answer, "sources": sources}
+        slot = self.next_slot
+        self.vectors[slot] = vec
+        self.created_at[slot] = time.time()
+        if slot < len(self.entries):
+            self.entries[slot] = entry
+        else:
+            self.entries.append(entry)
+        self.next_slot = (slot + 1) % self.capacity
+
+    def save(self, path: str):
+        """Persist to `<path>.npy` (vectors) and `<path>.json` (entries)"""
+        if not self.entries:
+            return
+        n = len(self.entries)
+        np.save(f"{path}.npy", self.vectors[:n])
+        with open(f"{path}.json", "w", encoding="utf-8") as f:
+            json.dump({
+                "fingerprint": self.fingerprint,
+                "next_slot": self.next_slot,
+                "created_at": self.created_at[:n].tolist(),
+                "entries": self.entries,
+            }, f)
+        logger.info(f"Saved {len(self.entries)} semantic cache entries to {path}")
+
+    def load(self, path: str, fingerprint: Optional[str]):
+        """
+        Restore a cache written by save(). Missing files are ignored; a cache
+        saved for a different knowledge-base fingerprint is discarded.
+        """
+        self.fingerprint = fingerprint
+        if not (os.path.exists(f"{path}.npy") and os.path.exists(f"{path}.json")):
+            return
+        with open(f"{path}.json", "r", encoding="utf-8") as f:
+            data = json.load(f)
+        if fingerprint is None or data.get("fingerprint") != fingerprint:
+            logger.info(f"Discarding semantic cache at {path}: knowledge base changed")
+            return
+        vectors = np.load(f"{path}.npy")
+
+        n = min(len(data["entries"]), len(vectors), len(data["created_at"]), self.capacity)
+        self.vectors = np.zeros((self.capacity, vectors.shape[1]), dtype=np.float32)
+        self.vectors[:n] = vectors[:n]
+        self.created_at[:n] = data["created_at"][:n]
+        self.entries = data["entries"][:n]
+        self.next_slot = data["next_slot"] % self.capacity if n == self.capacity else n
+        logger.info(f"Loaded {n} semantic cache entries from {path}")
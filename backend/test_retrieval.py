@@ -23,12 +23,12 @@ print(f"✅ Connected to Qdrant collection: {COLLECTION_NAME}\n")
 
 # ---------------- TEST FUNCTION ----------------
 def test_query(query_text: str, top_k: int = 3):
-    query_vector = EMBEDDER.encode(query_text).tolist()
-    results = client.search(
+    query_vector = EMBEDDER.encode(query_text, normalize_embeddings=True).tolist()
+    results = client.query_points(
         collection_name=COLLECTION_NAME,
-        query_vector=query_vector,
+        query=query_vector,
         limit=top_k
-    )
+    ).points
     print(f"🔍 Query: {query_text}")
     print("-" * 80)
     for i, r in enumerate(results, 1):
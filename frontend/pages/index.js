@@ -45,7 +45,7 @@ export default function Home() {
     abortRef.current = new AbortController();
 
     try {
-      const res = await fetch("http://127.0.0.1:8000/ask", {
+      const res = await fetch("http://127.0.0.1:8000/ask?stream=false", {
         method: "POST",
         headers: { "Content-Type": "application/json" },
         body: JSON.stringify({ question: userMessage.text }),